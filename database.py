@@ -5,12 +5,13 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import List, Union
 from pydantic import BaseModel
+from pymongo.errors import BulkWriteError
 
 # Load environment variables from .env file
 load_dotenv()
@@ -22,11 +23,19 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    _client = AsyncIOMotorClient(database_url, maxPoolSize=50, minPoolSize=5)
     db = _client[database_name]
 
+class PartialInsertError(Exception):
+    """Raised by create_documents when some documents of an unordered batch failed to insert"""
+    def __init__(self, inserted: int, inserted_ids: list, failed: list):
+        super().__init__(f"{len(failed)} document(s) failed to insert, {inserted} inserted")
+        self.inserted = inserted
+        self.inserted_ids = inserted_ids
+        self.failed = failed
+
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -40,10 +49,36 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
+async def create_documents(collection_name: str, items: List[Union[BaseModel, dict]]):
+    """Insert many documents with timestamps in a single unordered batch"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+    if not items:
+        return []
+
+    now = datetime.now(timezone.utc)
+    docs = []
+    for data in items:
+        data_dict = data.model_dump() if isinstance(data, BaseModel) else data.copy()
+        data_dict['created_at'] = now
+        data_dict['updated_at'] = now
+        docs.append(data_dict)
+
+    try:
+        result = await db[collection_name].insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # Unordered: every document without a write error was still inserted.
+        # insert_many assigns _id to each document before sending the batch.
+        failed = [{"index": w["index"], "message": w.get("errmsg", "")} for w in e.details.get("writeErrors", [])]
+        failed_indexes = {f["index"] for f in failed}
+        inserted_ids = [str(d["_id"]) for i, d in enumerate(docs) if i not in failed_indexes]
+        raise PartialInsertError(e.details.get("nInserted", len(inserted_ids)), inserted_ids, failed) from e
+    return [str(i) for i in result.inserted_ids]
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
     """Get documents from collection"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -52,4 +87,16 @@ def get_documents(collection_name: str, filter_dict: dict = None, limit: int = N
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=limit)
+
+def aggregate_cursor(collection_name: str, pipeline: list):
+    """Return an async cursor over an aggregation pipeline, for callers that want to stream results"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    return db[collection_name].aggregate(pipeline)
+
+async def aggregate_documents(collection_name: str, pipeline: list, limit: int = None):
+    """Run an aggregation pipeline server-side and return the resulting documents"""
+    cursor = aggregate_cursor(collection_name, pipeline)
+    return await cursor.to_list(length=limit)
@@ -1,36 +1,242 @@
+import asyncio
+import logging
 import os
+import re
+from collections import defaultdict
+from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi import FastAPI, HTTPException
+import msgspec
+import orjson
+from cachetools import TTLCache
+from fastapi import Body, FastAPI, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from typing import List, Optional
 
-from database import db, create_document, get_documents
-from schemas import Transaction, Budget, Message
+from database import db, create_document, create_documents, aggregate_cursor, aggregate_documents, PartialInsertError
+from schemas import Transaction, Budget, ChatMessage
 
-app = FastAPI(title="Personal Finance Assistant API")
+logger = logging.getLogger(__name__)
+
+
+async def create_indexes():
+    # Back the sorted list queries with indexes so they don't scan whole collections
+    if db is None:
+        return
+    try:
+        await asyncio.gather(
+            db.transaction.create_index([("date", -1)]),
+            db.budget.create_index([("category", 1)]),
+        )
+    except Exception as e:
+        logger.warning("Could not create indexes: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build indexes in the background so an unreachable database can't hold up
+    # startup for the driver's server-selection timeout
+    index_task = asyncio.create_task(create_indexes())
+    yield
+    if not index_task.done():
+        index_task.cancel()
+    await asyncio.gather(index_task, return_exceptions=True)
+
+
+app = FastAPI(title="Personal Finance Assistant API", default_response_class=ORJSONResponse, lifespan=lifespan)
+
+# Comma-separated list of allowed frontend origins. There is no wildcard fallback:
+# Starlette only reflects the request Origin when a Cookie header is present, so
+# "*" with credentials breaks Authorization-only requests in browsers. When unset,
+# cross-origin requests are refused.
+cors_origins = [o.strip() for o in os.getenv("FRONTEND_ORIGIN", "").split(",") if o.strip()]
+if not cors_origins:
+    logger.warning("FRONTEND_ORIGIN is not set; cross-origin requests will be refused")
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=cors_origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type", "Authorization"],
+)
+
+
+# Everything /api/chat needs in one round-trip: per-category totals split by sign,
+# computed by MongoDB, plus the budgets joined in from their own collection. Each
+# totals row is shaped like a transaction ({"category", "amount"}) so
+# analyze_finances works on it unchanged.
+CHAT_DATA_PIPELINE = [
+    {"$facet": {
+        "totals": [
+            {"$group": {
+                "_id": {
+                    "category": {"$toLower": {"$ifNull": ["$category", "uncategorized"]}},
+                    "income": {"$gt": ["$amount", 0]},
+                },
+                "amount": {"$sum": "$amount"},
+            }},
+            {"$project": {"_id": 0, "category": "$_id.category", "amount": 1}},
+        ],
+        "budgets": [
+            {"$limit": 1},
+            {"$lookup": {
+                "from": "budget",
+                "pipeline": [
+                    {"$sort": {"category": 1}},
+                    {"$limit": 100},
+                    {"$project": {"_id": 0, "category": 1, "amount": 1}},
+                ],
+                "as": "items",
+            }},
+            {"$project": {"_id": 0, "items": 1}},
+        ],
+    }},
+]
+
+
+# Chat intent keywords, matched as substrings of the lower-cased message
+SUMMARY_KWS = frozenset({"summary", "overview", "how am i doing", "net"})
+BUDGET_KWS = frozenset({"budget", "over budget", "overspent", "overspending"})
+TIPS_KWS = frozenset({"tip", "save", "improve", "advice"})
+
+INTENT_KEYWORDS = {
+    "summary": SUMMARY_KWS,
+    "budget": BUDGET_KWS,
+    "tips": TIPS_KWS,
+}
+
+def _alternation(keywords) -> str:
+    # Longest first so multi-word keys win over their prefixes
+    return "|".join(re.escape(k) for k in sorted(keywords, key=lambda k: (-len(k), k)))
+
+
+# Compiled once at import: a single pass over the message, one named group per
+# intent. Keys must start at a word boundary (so "internet" is not "net") but may
+# be a prefix of a longer word (so "tips" still means "tip").
+INTENT_RE = re.compile(
+    r"\b(?:" + "|".join(
+        f"(?P<{intent}>{_alternation(keywords)})" for intent, keywords in INTENT_KEYWORDS.items()
+    ) + ")"
+)
+
+
+def detect_intents(text: str) -> set:
+    return {m.lastgroup for m in INTENT_RE.finditer(text)}
+
+
+# Chat insights are recomputed at most every 30s, or sooner after a write. The cache
+# and its invalidation are per process: a write only clears the worker that handled
+# it, so this is only fresh-after-write when running a single worker.
+INSIGHTS_TTL_SECONDS = 30
+_insights_cache = TTLCache(maxsize=1, ttl=INSIGHTS_TTL_SECONDS)
+# Bumped on every write so an in-flight computation that started before the write
+# doesn't store figures that miss it
+_insights_generation = 0
+
+
+def _invalidate_insights():
+    global _insights_generation
+    _insights_generation += 1
+    _insights_cache.clear()
+
+# /test reports collection names; cache them so frequent probes don't hit the cluster
+COLLECTIONS_TTL_SECONDS = 30
+_collections_cache = TTLCache(maxsize=1, ttl=COLLECTIONS_TTL_SECONDS)
+
+
+# Largest batch accepted by POST /api/transactions/bulk
+MAX_BULK_ITEMS = 1000
+
+# Upper bound for ?limit= on the list endpoints; limit=0 means "up to this many"
+MAX_LIST_LIMIT = 10000
+
+
+def listing_pipeline(sort: dict, limit: int) -> list:
+    # Sort/limit first, then let MongoDB render _id as a string "id" field
+    return [
+        {"$sort": sort},
+        {"$limit": limit or MAX_LIST_LIMIT},
+        {"$addFields": {"id": {"$toString": "$_id"}}},
+        {"$project": {"_id": 0}},
+    ]
+
+
+# Reply and tip templates, rendered with %-formatting
+SAVINGS_RATE_TIP = "Your savings rate is %.0f%%. Aim for 20%%+ where possible."
+OVER_BUDGET_TIP = "You're over budget in %s by $%.2f. Consider reducing spend or increasing the budget."
+TOP_EXPENSE_TIP = "Largest expense category is %s at $%.2f. See if there are ways to trim this."
+SUMMARY_REPLY = "Here's your overview: Income $%.2f, Expenses $%.2f, Net $%.2f."
+OVER_BUDGET_REPLY = "Over budget in %s: spent $%.2f vs budget $%.2f."
+WITHIN_BUDGET_REPLY = "You're within all budgets based on current data."
+NO_TIPS_REPLY = "Keep tracking your spending to build trends."
+DEFAULT_REPLY = (
+    "I can summarize your finances, track budgets, and give tips. "
+    "Currently: income $%.2f, expenses $%.2f. Ask 'show budget' or 'give tips'."
 )
 
 
-class ChatRequest(BaseModel):
+# Chat payloads are decoded straight from the request body with msgspec,
+# bypassing FastAPI's pydantic layer on this hot path
+class ChatRequest(msgspec.Struct):
     message: str
-    history: Optional[List[Message]] = None
+    history: Optional[List[ChatMessage]] = None
+
+
+def _inline_refs(schema, defs: dict):
+    # msgspec emits "#/$defs/..." refs, which don't resolve inside an OpenAPI document
+    if isinstance(schema, dict):
+        if "$ref" in schema:
+            return _inline_refs(defs[schema["$ref"].rsplit("/", 1)[-1]], defs)
+        return {k: _inline_refs(v, defs) for k, v in schema.items()}
+    if isinstance(schema, list):
+        return [_inline_refs(v, defs) for v in schema]
+    return schema
+
+
+_chat_schema = msgspec.json.schema(ChatRequest)
+CHAT_OPENAPI_EXTRA = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": _inline_refs(_chat_schema, _chat_schema.get("$defs", {}))}},
+    },
+    "responses": {
+        "422": {
+            "description": "Validation Error",
+            "content": {"application/json": {"schema": {"$ref": "#/components/schemas/HTTPValidationError"}}},
+        }
+    },
+}
+
+def _msgspec_errors(e: msgspec.DecodeError) -> list:
+    # FastAPI's [{"loc", "msg", "type"}] shape. msgspec exposes no structured error
+    # path, so errors are reported against the whole body with msgspec's message.
+    error_type = "value_error" if isinstance(e, msgspec.ValidationError) else "json_invalid"
+    return [{"loc": ["body"], "msg": str(e), "type": error_type}]
 
 
 @app.get("/")
-def root():
+async def root():
     return {"status": "ok", "service": "Personal Finance Assistant API"}
 
 
+@app.get("/healthz")
+async def healthz():
+    # Liveness only; never touches the database
+    return {"status": "ok"}
+
+
+async def _list_collections():
+    collections = _collections_cache.get("collections")
+    if collections is None:
+        collections = await db.list_collection_names()
+        _collections_cache["collections"] = collections
+    return collections
+
+
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -47,7 +253,7 @@ def test_database():
             response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                collections = await _list_collections()
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
@@ -65,22 +271,54 @@ def test_database():
 
 # --- Transactions ---
 @app.post("/api/transactions")
-def add_transaction(tx: Transaction):
+async def add_transaction(tx: Transaction):
     try:
-        inserted_id = create_document("transaction", tx)
+        inserted_id = await create_document("transaction", tx)
+        _invalidate_insights()
         return {"id": inserted_id, "ok": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/transactions/bulk")
+async def add_transactions(txs: List[Transaction] = Body(..., max_length=MAX_BULK_ITEMS)):
+    try:
+        inserted_ids = await create_documents("transaction", txs)
+        return {"ids": inserted_ids, "ok": True}
+    except PartialInsertError as e:
+        raise HTTPException(status_code=500, detail={
+            "message": str(e),
+            "inserted": e.inserted,
+            "ids": e.inserted_ids,
+            "failed": e.failed,
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Unordered inserts can land rows even when the batch reports errors
+        _invalidate_insights()
+
+
+async def _ndjson_lines(first, cursor):
+    if first is not None:
+        yield orjson.dumps(first) + b"\n"
+    async for d in cursor:
+        yield orjson.dumps(d) + b"\n"
+
+
 @app.get("/api/transactions")
-def list_transactions(limit: int = 100):
+async def list_transactions(request: Request, limit: int = Query(100, ge=0, le=MAX_LIST_LIMIT)):
     try:
-        docs = get_documents("transaction", {}, limit)
-        # Convert ObjectId to str
-        for d in docs:
-            if "_id" in d:
-                d["id"] = str(d.pop("_id"))
+        pipeline = listing_pipeline({"date": -1}, limit)
+        # Clients asking for NDJSON get documents streamed as the cursor yields them
+        if "application/x-ndjson" in request.headers.get("accept", ""):
+            cursor = aggregate_cursor("transaction", pipeline)
+            # The aggregate is lazy: pull the first document now so query errors still
+            # surface as a 500 instead of after the 200 headers have been sent
+            first = await anext(cursor, None)
+            return StreamingResponse(_ndjson_lines(first, cursor), media_type="application/x-ndjson")
+
+        docs = await aggregate_documents("transaction", pipeline)
         return {"items": docs}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -88,21 +326,19 @@ def list_transactions(limit: int = 100):
 
 # --- Budgets ---
 @app.post("/api/budgets")
-def add_budget(b: Budget):
+async def add_budget(b: Budget):
     try:
-        inserted_id = create_document("budget", b)
+        inserted_id = await create_document("budget", b)
+        _invalidate_insights()
         return {"id": inserted_id, "ok": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/budgets")
-def list_budgets(limit: int = 100):
+async def list_budgets(limit: int = Query(100, ge=0, le=MAX_LIST_LIMIT)):
     try:
-        docs = get_documents("budget", {}, limit)
-        for d in docs:
-            if "_id" in d:
-                d["id"] = str(d.pop("_id"))
+        docs = await aggregate_documents("budget", listing_pipeline({"category": 1}, limit))
         return {"items": docs}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -110,29 +346,33 @@ def list_budgets(limit: int = 100):
 
 # --- Simple rule-based Chatbot ---
 def analyze_finances(transactions: List[dict], budgets: List[dict]):
-    # Basic insights without external AI dependencies
-    total_income = sum(t.get("amount", 0) for t in transactions if t.get("amount", 0) > 0)
-    total_expense = -sum(min(t.get("amount", 0), 0) for t in transactions)
-    net = total_income - total_expense
-
-    by_category = {}
+    # Basic insights without external AI dependencies, in a single pass over the rows
+    total_income = 0
+    total_expense = 0
+    by_category = defaultdict(float)
     for t in transactions:
-        cat = t.get("category", "uncategorized").lower()
-        by_category[cat] = by_category.get(cat, 0) + t.get("amount", 0)
+        amount = t.get("amount", 0)
+        if amount > 0:
+            total_income += amount
+        else:
+            total_expense -= amount
+        by_category[t.get("category", "uncategorized").lower()] += amount
+    net = total_income - total_expense
 
+    # Lower-case each budget category once and look its spend up directly
     overs = []
     for b in budgets:
-        spent = -sum(v for k, v in by_category.items() if k == b.get("category", "").lower() and v < 0)
+        total = by_category.get(b.get("category", "").lower(), 0)
+        spent = -total if total < 0 else 0
         if spent > b.get("amount", 0):
             overs.append({"category": b["category"], "spent": spent, "budget": b["amount"]})
 
     tips = []
     if total_expense > 0 and total_income > 0:
         savings_rate = max((total_income - total_expense) / total_income, 0)
-        tips.append(f"Your savings rate is {savings_rate:.0%}. Aim for 20%+ where possible.")
-    if overs:
-        for o in overs:
-            tips.append(f"You're over budget in {o['category']} by ${o['spent'] - o['budget']:.2f}. Consider reducing spend or increasing the budget.")
+        tips.append(SAVINGS_RATE_TIP % (savings_rate * 100))
+    tips += [OVER_BUDGET_TIP % (o["category"], o["spent"] - o["budget"]) for o in overs]
+    # Largest expense is decided on category totals, so it needs the finished by_category
     top_exp_cat = None
     max_spend = 0
     for cat, val in by_category.items():
@@ -140,7 +380,7 @@ def analyze_finances(transactions: List[dict], budgets: List[dict]):
             max_spend = -val
             top_exp_cat = cat
     if top_exp_cat:
-        tips.append(f"Largest expense category is {top_exp_cat} at ${max_spend:.2f}. See if there are ways to trim this.")
+        tips.append(TOP_EXPENSE_TIP % (top_exp_cat, max_spend))
 
     return {
         "summary": {
@@ -153,46 +393,54 @@ def analyze_finances(transactions: List[dict], budgets: List[dict]):
     }
 
 
-@app.post("/api/chat")
-def chat(req: ChatRequest):
+async def _compute_insights():
+    insights = _insights_cache.get("insights")
+    if insights is not None:
+        return insights
+    generation = _insights_generation
+
     # Pull latest data to ground responses
-    txs = get_documents("transaction", {}, 500)
-    buds = get_documents("budget", {}, 100)
-    for d in txs:
-        if "_id" in d:
-            d.pop("_id")
-    for d in buds:
-        if "_id" in d:
-            d.pop("_id")
+    rows = await aggregate_documents("transaction", CHAT_DATA_PIPELINE)
+    data = rows[0] if rows else {}
+    txs = data.get("totals", [])
+    # No transactions means the budgets facet has nothing to run on, but then
+    # nothing can be over budget either
+    buds = data["budgets"][0]["items"] if data.get("budgets") else []
 
     insights = analyze_finances(txs, buds)
+    if generation == _insights_generation:
+        _insights_cache["insights"] = insights
+    return insights
+
+
+@app.post("/api/chat", openapi_extra=CHAT_OPENAPI_EXTRA)
+async def chat(request: Request):
+    try:
+        req = msgspec.json.decode(await request.body(), type=ChatRequest)
+    except msgspec.DecodeError as e:
+        raise RequestValidationError(_msgspec_errors(e))
+
+    insights = await _compute_insights()
 
     user_q = req.message.lower()
+    intents = detect_intents(user_q)
     reply_parts: List[str] = []
 
-    if any(k in user_q for k in ["summary", "overview", "how am i doing", "net"]):
+    if "summary" in intents:
         s = insights["summary"]
-        reply_parts.append(
-            f"Here's your overview: Income ${s['income']:.2f}, Expenses ${s['expense']:.2f}, Net ${s['net']:.2f}."
-        )
-    if any(k in user_q for k in ["budget", "over budget", "overspent", "overspending"]):
+        reply_parts.append(SUMMARY_REPLY % (s["income"], s["expense"], s["net"]))
+    if "budget" in intents:
         if insights["overs"]:
-            for o in insights["overs"]:
-                reply_parts.append(
-                    f"Over budget in {o['category']}: spent ${o['spent']:.2f} vs budget ${o['budget']:.2f}."
-                )
+            reply_parts += [OVER_BUDGET_REPLY % (o["category"], o["spent"], o["budget"]) for o in insights["overs"]]
         else:
-            reply_parts.append("You're within all budgets based on current data.")
-    if any(k in user_q for k in ["tip", "save", "improve", "advice"]):
-        reply_parts += insights["tips"] or ["Keep tracking your spending to build trends."]
+            reply_parts.append(WITHIN_BUDGET_REPLY)
+    if "tips" in intents:
+        reply_parts += insights["tips"] or [NO_TIPS_REPLY]
 
     if not reply_parts:
         # Default helpful response
         s = insights["summary"]
-        reply_parts.append(
-            "I can summarize your finances, track budgets, and give tips. "
-            f"Currently: income ${s['income']:.2f}, expenses ${s['expense']:.2f}. Ask 'show budget' or 'give tips'."
-        )
+        reply_parts.append(DEFAULT_REPLY % (s["income"], s["expense"]))
 
     return {
         "reply": " ".join(reply_parts),
@@ -203,4 +451,7 @@ def chat(req: ChatRequest):
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # One worker unless set explicitly: the insights cache and its write
+    # invalidation are per process, so extra workers can serve stale totals
+    workers = int(os.getenv("WEB_CONCURRENCY", 1))
+    uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers)
@@ -2,9 +2,14 @@
 Database Schemas for Personal Finance Assistant
 
 Each Pydantic model maps to a MongoDB collection (lowercased class name).
+
+Models strip surrounding whitespace from strings and reject unknown fields
+with a 422, so a document fetched from a list endpoint (which carries id,
+created_at and updated_at) cannot be posted back unchanged.
 """
 
-from pydantic import BaseModel, Field
+import msgspec
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, Literal
 
 class Transaction(BaseModel):
@@ -12,6 +17,8 @@ class Transaction(BaseModel):
     Personal finance transactions
     Collection: "transaction"
     """
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
     amount: float = Field(..., description="Transaction amount (positive for income, negative for expense)")
     category: str = Field(..., description="Category (e.g., groceries, rent, salary)")
     date: str = Field(..., description="ISO date string, e.g., 2025-01-31")
@@ -23,6 +30,8 @@ class Budget(BaseModel):
     Category budgets
     Collection: "budget"
     """
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
     category: str = Field(..., description="Budget category")
     amount: float = Field(..., ge=0, description="Budgeted amount for the period")
     period: Literal["monthly", "weekly"] = Field("monthly", description="Budget period")
@@ -32,6 +41,40 @@ class Message(BaseModel):
     Chat messages (optional persistence)
     Collection: "message"
     """
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
     role: Literal["user", "assistant"] = Field(...)
     content: str = Field(...)
     context: Optional[str] = Field(None)
+
+
+def struct_from_model(model: type, name: str) -> type:
+    """
+    Build a msgspec Struct with the same fields, defaults and config
+    (extra="forbid", str_strip_whitespace) as a pydantic model
+    """
+    fields = []
+    for field_name, info in model.model_fields.items():
+        if info.is_required():
+            fields.append((field_name, info.annotation))
+        else:
+            fields.append((field_name, info.annotation, info.default))
+
+    namespace = {}
+    if model.model_config.get("str_strip_whitespace"):
+        def __post_init__(self):
+            for field_name in self.__struct_fields__:
+                value = getattr(self, field_name)
+                if isinstance(value, str):
+                    setattr(self, field_name, value.strip())
+        namespace["__post_init__"] = __post_init__
+
+    return msgspec.defstruct(
+        name,
+        fields,
+        namespace=namespace,
+        forbid_unknown_fields=model.model_config.get("extra") == "forbid",
+    )
+
+# Chat history entries decoded by /api/chat; derived from Message so the two can't drift
+ChatMessage = struct_from_model(Message, "ChatMessage")